@@ -1,69 +1,259 @@
+import eventlet
+eventlet.monkey_patch()  # must run before anything imports socket/threading
+from eventlet.pools import Pool
+from eventlet.semaphore import Semaphore
+
+import hashlib
+import io
+import itertools
+import mimetypes
 import os
+import queue
 import re
-import uuid
-from threading import Thread
+import secrets
+import shutil
+import subprocess
+import threading
+import time
+import zipfile
+from urllib.parse import quote
+from cachetools import TTLCache
 from flask import Flask, render_template, request, jsonify, send_file, after_this_request
 from flask_socketio import SocketIO, join_room
 import yt_dlp
+from yt_dlp.postprocessor import FFmpegPostProcessor
+from yt_dlp.utils import prepend_extension, replace_extension
 import imageio_ffmpeg
+import orjson
+
+
+class OrjsonAdapter:
+    """json-module shim so Socket.IO/Engine.IO packets are encoded by orjson."""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        # python-socketio passes separators=...; orjson output is already compact
+        return orjson.dumps(obj).decode()
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet", json=OrjsonAdapter)
 
 DOWNLOAD_DIR = os.path.join(os.getcwd(), "downloads")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
+# Stage intermediates (fragments, pre-merge streams, re-encodes) on tmpfs when
+# available; only the finished file is moved into DOWNLOAD_DIR for serving
+STAGING_DIR = "/dev/shm/downloads" if os.path.isdir("/dev/shm") else None
+# Skip tmpfs for a download unless this much RAM-backed space is free
+STAGING_MIN_FREE = int(os.environ.get("STAGING_MIN_FREE_MB") or 2048) * 1024 * 1024
+if STAGING_DIR:
+    os.makedirs(STAGING_DIR, exist_ok=True)
+
+# Optional: let a fronting proxy stream files with sendfile(2)
+#   X_ACCEL_PREFIX=/protected/ -> nginx: location /protected/ { internal; alias <DOWNLOAD_DIR>/; }
+#   USE_X_SENDFILE=1           -> Apache/lighttpd mod_xsendfile
+X_ACCEL_PREFIX = os.environ.get("X_ACCEL_PREFIX", "")
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE") == "1"
+# The proxy reads the file after we respond, so wait before deleting it
+PROXY_CLEANUP_DELAY = 600
+
+# Served files waiting to be unlinked by delete_worker()
+DELETE_QUEUE = queue.Queue()
+DELETE_BATCH_SIZE = 32
+
+
+def entry_paths(info: dict) -> list[str]:
+    """Files on disk behind a DOWNLOAD_MAP entry (single file or batch)."""
+    if "files" in info:
+        return [path for path, _ in info["files"]]
+    return [info["path"]]
+
+
+class DownloadMap(TTLCache):
+    """Token cache whose expired or evicted entries also lose their files."""
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, info in expired:
+            for path in entry_paths(info):
+                DELETE_QUEUE.put(path)
+        return expired
+
+    def popitem(self):
+        key, info = super().popitem()
+        for path in entry_paths(info):
+            DELETE_QUEUE.put(path)
+        return key, info
+
+
 # token -> {"path": final_file_path, "name": download_name}
-DOWNLOAD_MAP = {}
+#       or {"files": [(path, name), ...], "name": zip_name} for batches
+# Links that are never fetched expire after an hour (bounds memory and disk)
+DOWNLOAD_MAP = DownloadMap(maxsize=10_000, ttl=3600)
+DOWNLOAD_MAP_LOCK = threading.RLock()
+DOWNLOAD_SWEEP_INTERVAL = 60
+
+# Cap concurrent downloads (default: one per vCPU) so a burst of users
+# queues up instead of oversubscribing the CPU with ffmpeg jobs
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS") or os.cpu_count() or 1)
+DOWNLOAD_SLOTS = Semaphore(MAX_CONCURRENT_DOWNLOADS)
+
+# /batch_download limits and ZIP streaming block size
+MAX_BATCH_URLS = 20
+BATCH_ZIP_NAME = "youd0wnload-batch.zip"
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+# Parallel fragment downloads for DASH/HLS formats (per download)
+CONCURRENT_FRAGMENTS = int(os.environ.get("CONCURRENT_FRAGMENTS") or 8)
 
 # Resolve an ffmpeg binary path (works on Render)
 FFMPEG_PATH = imageio_ffmpeg.get_ffmpeg_exe()
 
+# NVENC encoder to use when a CUDA device is present (h264_nvenc or hevc_nvenc)
+NVENC_CODEC = os.environ.get("NVENC_CODEC", "h264_nvenc")
+
+
+def probe_nvenc() -> bool:
+    """Check once whether ffmpeg can actually encode with NVENC on this host."""
+    try:
+        # "-h encoder=..." only proves the encoder is compiled in; a one-frame
+        # null encode fails fast when no CUDA device/driver is available.
+        help_run = subprocess.run(
+            [FFMPEG_PATH, "-hide_banner", "-h", f"encoder={NVENC_CODEC}"],
+            capture_output=True, text=True, timeout=10,
+        )
+        if help_run.returncode != 0 or "not recognized" in help_run.stdout:
+            return False
+        test_run = subprocess.run(
+            [FFMPEG_PATH, "-hide_banner", "-loglevel", "error",
+             "-f", "lavfi", "-i", "color=c=black:s=256x256",
+             "-frames:v", "1", "-c:v", NVENC_CODEC, "-f", "null", "-"],
+            capture_output=True, timeout=20,
+        )
+        return test_run.returncode == 0
+    except Exception:
+        return False
+
+
+HAS_NVENC = probe_nvenc()
+print(f"[INFO] NVENC available: {HAS_NVENC} ({NVENC_CODEC})")
+
+# Input/output args for the video re-encode (GPU NVENC when present, else libx264)
+if HAS_NVENC:
+    VIDEO_DECODE_ARGS = ["-hwaccel", "cuda"]
+    VIDEO_ENCODE_ARGS = [
+        "-c:v", NVENC_CODEC,
+        "-preset", "p4",
+        "-tune", "hq",
+        "-rc", "vbr",
+        "-b:v", "0",
+        "-cq", "23",
+    ]
+else:
+    VIDEO_DECODE_ARGS = []
+    # veryfast encodes ~3-5x faster than the default "medium" for slightly
+    # larger files; -threads 0 lets x264 use every vCPU (frame threading)
+    VIDEO_ENCODE_ARGS = [
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-threads", "0",
+    ]
+
+
+class Mp4CompatPP(FFmpegPostProcessor):
+    """Make the download a browser-friendly MP4, re-encoding only if needed."""
+
+    @staticmethod
+    def _codec(formats, kind):
+        for f in formats:
+            codec = f.get(kind)
+            if codec and codec != "none":
+                return codec.lower()
+        return ""
+
+    def run(self, info):
+        path = info["filepath"]
+        formats = info.get("requested_formats") or [info]
+        vcodec = self._codec(formats, "vcodec")
+        acodec = self._codec(formats, "acodec")
+
+        # The merger already stream-copied into MP4 (+faststart); nothing to do
+        if info.get("ext") == "mp4" and vcodec.startswith(("avc1", "h264")) \
+                and acodec.startswith(("mp4a", "aac")):
+            self.to_screen(f"Streams are already H.264/AAC; keeping {path}")
+            return [], info
+
+        if info.get("ext") == "mp4":
+            out_path = prepend_extension(path, "temp")
+        else:
+            out_path = replace_extension(path, "mp4", info.get("ext"))
+        self.to_screen(f"Re-encoding {vcodec or '?'}/{acodec or '?'} to H.264/AAC; Destination: {out_path}")
+        self.real_run_ffmpeg(
+            [(path, VIDEO_DECODE_ARGS)],
+            [(out_path, VIDEO_ENCODE_ARGS + [
+                "-c:a", "aac",
+                "-b:a", "192k",
+                "-pix_fmt", "yuv420p",
+            ])],
+        )
+
+        if info.get("ext") == "mp4":
+            os.replace(out_path, path)
+            return [], info
+        info["filepath"] = out_path
+        info["ext"] = "mp4"
+        return [path], info
+
+
 # Strip ANSI color codes from yt-dlp strings (so they render cleanly in browser)
 ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
 def strip_ansi(s: str | None) -> str:
-    return ANSI_RE.sub('', s or '')
+    if not s:
+        return ''
+    # "color": "never" means escapes are rare; skip the regex when there are none
+    if '\x1b' not in s:
+        return s
+    return ANSI_RE.sub('', s)
+
+
+# Anything but (Unicode) letters/digits, spaces and dashes
+SANITIZE_RE = re.compile(r'(?:[^\w \-]|_)+')
 
 
 def sanitize_filename(name: str) -> str:
     """Turn a video title into a safe, short filename."""
     if not name:
         return "download"
-    cleaned = []
-    for ch in name:
-        if ch.isalnum() or ch in {" ", "-"}:
-            cleaned.append(ch)
-        else:
-            cleaned.append(" ")
-    base = "-".join("".join(cleaned).split())
+    base = "-".join(SANITIZE_RE.sub(" ", name).split())
     return (base.strip("-") or "download")[:120]
 
 
+def norm_url(u: str) -> str:
+    """Make protocol-relative URLs absolute."""
+    if u.startswith("//"):
+        return "https:" + u
+    return u
+
+
 def pick_thumbnail(info: dict) -> str | None:
     """Pick a robust thumbnail (direct -> largest -> ytimg fallback)."""
-    def norm(u: str) -> str:
-        if u.startswith("//"):
-            return "https:" + u
-        return u
-
     t = info.get("thumbnail")
     if t:
-        return norm(t)
+        return norm_url(t)
 
     thumbs = info.get("thumbnails") or []
-    best_url, best_area = None, -1
-    for th in thumbs:
-        url = th.get("url")
-        if not url:
-            continue
-        w = int(th.get("width") or 0)
-        h = int(th.get("height") or 0)
-        area = w * h
-        if area > best_area:
-            best_area, best_url = area, norm(url)
-
-    if best_url:
-        return best_url
+    best = max(
+        (th for th in thumbs if th.get("url")),
+        key=lambda th: int(th.get("width") or 0) * int(th.get("height") or 0),
+        default=None,
+    )
+    if best:
+        return norm_url(best["url"])
 
     vid = info.get("id")
     if vid:
@@ -71,6 +261,65 @@ def pick_thumbnail(info: dict) -> str | None:
     return None
 
 
+# Browser-like UA shared by info fetches and downloads
+HTTP_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/124.0 Safari/537.36"
+    )
+}
+
+# Force the standard web player client to avoid GVS/PO token quirks
+EXTRACTOR_ARGS = {"youtube": {"player_client": ["web"]}}
+
+# Safer defaults for PaaS networks (IPv4 + web client + UA; no colors),
+# shared by info fetches and downloads
+COMMON_OPTS = {
+    "color": "never",
+    "force_ipv4": True,
+    "ffmpeg_location": FFMPEG_PATH,  # harmless during info fetch
+    "extractor_args": EXTRACTOR_ARGS,
+    "http_headers": HTTP_HEADERS,
+}
+
+INFO_OPTS = {**COMMON_OPTS, "quiet": True, "skip_download": True}
+
+# Reused YoutubeDL instances for /get_info; building one per request
+# re-initialises every extractor and the HTTP opener each time
+INFO_POOL_SIZE = 4
+# Close and rebuild a pooled instance after this many uses so its cached
+# HTTP connections (and their FDs) don't accumulate in a long-lived worker
+INFO_YDL_MAX_USES = 200
+
+
+class InfoYDLPool(Pool):
+    """Pool of YoutubeDL instances that are recycled after INFO_YDL_MAX_USES."""
+
+    def __init__(self, *args, **kwargs):
+        self._uses = {}
+        super().__init__(*args, **kwargs)
+
+    def create(self):
+        # YoutubeDL mutates the params it is given, so each gets its own copy
+        return yt_dlp.YoutubeDL(dict(INFO_OPTS))
+
+    def put(self, ydl):
+        uses = self._uses.pop(ydl, 0) + 1
+        if uses >= INFO_YDL_MAX_USES:
+            ydl.close()
+            ydl, uses = self.create(), 0
+        self._uses[ydl] = uses
+        super().put(ydl)
+
+
+INFO_YDL_POOL = InfoYDLPool(max_size=INFO_POOL_SIZE)
+
+# url -> (title, thumbnail); previews/retries often repeat the same URL
+INFO_CACHE = TTLCache(maxsize=1024, ttl=300)
+INFO_CACHE_LOCK = threading.Lock()
+
+
 @app.route("/")
 def home():
     return render_template("index.html")
@@ -84,32 +333,25 @@ def get_info():
     if not url:
         return jsonify({"error": "No URL provided"}), 400
 
-    # Safer defaults for PaaS networks (IPv4 + web client + UA; no colors)
-    base_opts = {
-        "quiet": True,
-        "skip_download": True,
-        "color": "never",
-        "force_ipv4": True,
-        "ffmpeg_location": FFMPEG_PATH,  # harmless during info fetch
-        "extractor_args": {
-            # Force the standard web player client to avoid GVS/PO token quirks
-            "youtube": {"player_client": ["web"]}
-        },
-        "http_headers": {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/124.0 Safari/537.36"
-            )
-        },
-    }
+    with INFO_CACHE_LOCK:
+        hit = INFO_CACHE.get(url)
+    if hit:
+        title, thumb = hit
+        return jsonify({"title": title, "thumbnail": thumb})
 
     try:
-        with yt_dlp.YoutubeDL(base_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            thumb = pick_thumbnail(info)
-            print(f"[DEBUG] Title: {info.get('title')!r} | Thumb: {thumb!r}")
-            return jsonify({"title": info.get("title"), "thumbnail": thumb})
+        with INFO_YDL_POOL.item() as ydl:
+            # Only top-level metadata is needed; skip format sorting/selection
+            info = ydl.extract_info(url, download=False, process=False)
+            if info.get("_type") in ("url", "url_transparent"):
+                # Redirect-style result (no metadata yet) -> resolve it fully
+                info = ydl.extract_info(url, download=False)
+            title, thumb = info.get("title"), pick_thumbnail(info)
+            print(f"[DEBUG] Title: {title!r} | Thumb: {thumb!r}")
+        # Cache only the small result, never the full info dict
+        with INFO_CACHE_LOCK:
+            INFO_CACHE[url] = (title, thumb)
+        return jsonify({"title": title, "thumbnail": thumb})
     except Exception as e:
         # Print full error in logs to help diagnose
         print(f"[ERROR] get_info failed: {e}")
@@ -126,12 +368,24 @@ def handle_subscribe(data):
     return {"ok": False, "error": "missing progress_id"}
 
 
+# Minimum seconds between "downloading" progress events per download
+PROGRESS_MIN_INTERVAL = 0.1
+
+
 def make_progress_hook(progress_id: str):
     """Build a yt-dlp progress hook that emits events to the room."""
+    last_emit = 0.0
+
     def hook(d):
+        nonlocal last_emit
         try:
             st = d.get("status")
             if st == "downloading":
+                # Throttle the hot path; status changes always go through
+                now = time.monotonic()
+                if now - last_emit < PROGRESS_MIN_INTERVAL:
+                    return
+                last_emit = now
                 socketio.emit("progress", {
                     "status": "downloading",
                     "percent": strip_ansi((d.get("_percent_str") or "").strip()),
@@ -147,81 +401,99 @@ def make_progress_hook(progress_id: str):
     return hook
 
 
+# Unguessable tokens without a urandom read per call: SHA-256 (SHA-NI via
+# OpenSSL) over a secret per-process seed and a counter
+_TOKEN_SEED = secrets.token_bytes(32)
+_TOKEN_COUNTER = itertools.count()
+
+
+def new_token() -> str:
+    """Return a fresh 32-char hex token."""
+    n = next(_TOKEN_COUNTER)
+    return hashlib.sha256(_TOKEN_SEED + n.to_bytes(8, "little")).hexdigest()[:32]
+
+
+def staging_paths() -> dict:
+    """yt-dlp "paths" option: tmpfs temp dir when it has room, else disk only."""
+    paths = {"home": DOWNLOAD_DIR}
+    if STAGING_DIR:
+        try:
+            if shutil.disk_usage(STAGING_DIR).free >= STAGING_MIN_FREE:
+                paths["temp"] = STAGING_DIR
+        except OSError:
+            pass
+    return paths
+
+
+def fetch_media(url, option, progress_id) -> tuple[str, str]:
+    """Download one URL with yt-dlp; return (final_path, download_name)."""
+    ext = "mp4" if option == "1" else "mp3"
+    unique_id = new_token()[:6]  # ensure filesystem uniqueness
+    outtmpl = f"%(title)s-{unique_id}.%(ext)s"  # relative to "paths"
+
+    ydl_opts = {
+        **COMMON_OPTS,
+        "outtmpl": outtmpl,
+        "paths": staging_paths(),
+        "merge_output_format": "mp4" if option == "1" else None,
+        "progress_hooks": [make_progress_hook(progress_id)],
+        "quiet": False,
+        "verbose": True,
+        "overwrites": True,
+        "concurrent_fragment_downloads": CONCURRENT_FRAGMENTS,
+        "retries": 3,
+        "fragment_retries": 3,
+        # Ranged 10 MiB requests for progressive formats (avoids YouTube throttling)
+        "http_chunk_size": 10 * 1024 * 1024,
+    }
+
+    if option == "1":
+        # Video: prefer streams that are already MP4-compatible (H.264 + AAC)
+        # so the merge is a plain remux; Mp4CompatPP re-encodes otherwise.
+        ydl_opts.update({
+            "format": "bestvideo[vcodec^=avc1]+bestaudio[acodec^=mp4a]/bestvideo+bestaudio",
+        })
+    else:
+        # Audio: MP3
+        ydl_opts.update({
+            "format": "bestaudio/best",
+            "postprocessors": [
+                {"key": "FFmpegExtractAudio", "preferredcodec": "mp3", "preferredquality": "192"},
+            ],
+        })
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        if option == "1":
+            ydl.add_post_processor(Mp4CompatPP(ydl), when="post_process")
+        info = ydl.extract_info(url, download=True)
+
+        # Resolve final path after postprocessing
+        final_path = os.path.splitext(ydl.prepare_filename(info))[0] + "." + ext
+
+        # Verify final file exists and non-empty (one stat call)
+        try:
+            empty = os.stat(final_path).st_size == 0
+        except FileNotFoundError:
+            empty = True
+        if empty:
+            raise RuntimeError("The downloaded file is empty")
+
+        # Friendly name for browser download prompt
+        title = sanitize_filename(info.get("title", "download"))
+        download_name = f"{title}.{ext}"
+
+    return final_path, download_name
+
+
 def run_download(url, option, progress_id):
     """Run yt-dlp in background, then provide a token-based link when ready."""
     try:
-        ext = "mp4" if option == "1" else "mp3"
-        unique_id = uuid.uuid4().hex[:6]  # ensure filesystem uniqueness
-        outtmpl = os.path.join(DOWNLOAD_DIR, f"%(title)s-{unique_id}.%(ext)s")
-
-        ydl_opts = {
-            "outtmpl": outtmpl,
-            "merge_output_format": "mp4" if option == "1" else None,
-            "progress_hooks": [make_progress_hook(progress_id)],
-            "quiet": False,
-            "verbose": True,
-            "overwrites": True,
-            "color": "never",
-            "force_ipv4": True,
-            "ffmpeg_location": FFMPEG_PATH,
-            "extractor_args": {
-                "youtube": {"player_client": ["web"]}
-            },
-            "http_headers": {
-                "User-Agent": (
-                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/124.0 Safari/537.36"
-                )
-            },
-        }
-
-        if option == "1":
-            # Video: best streams + convert to MP4 (H.264 + AAC)
-            ydl_opts.update({
-                "format": "bestvideo+bestaudio",
-                "postprocessors": [
-                    {"key": "FFmpegVideoConvertor", "preferedformat": "mp4"},
-                ],
-                "postprocessor_args": [
-                    "-c:v", "libx264",
-                    "-c:a", "aac",
-                    "-b:a", "192k",
-                    "-movflags", "faststart",
-                    "-pix_fmt", "yuv420p",
-                ],
-            })
-        else:
-            # Audio: MP3
-            ydl_opts.update({
-                "format": "bestaudio/best",
-                "postprocessors": [
-                    {"key": "FFmpegExtractAudio", "preferredcodec": "mp3", "preferredquality": "192"},
-                ],
-            })
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-
-            # Resolve final path after postprocessing
-            final_path = ydl.prepare_filename(info)
-            if option == "2":
-                final_path = os.path.splitext(final_path)[0] + ".mp3"
-            else:
-                final_path = os.path.splitext(final_path)[0] + ".mp4"
-
-            # Verify final file exists and non-empty
-            if not os.path.exists(final_path) or os.path.getsize(final_path) == 0:
-                socketio.emit("progress", {"status": "error", "message": "The downloaded file is empty"}, to=progress_id)
-                return
-
-            # Friendly name for browser download prompt
-            title = sanitize_filename(info.get("title", "download"))
-            download_name = f"{title}.{ext}"
+        final_path, download_name = fetch_media(url, option, progress_id)
 
         # Map a one-time token to this file
-        token = uuid.uuid4().hex
-        DOWNLOAD_MAP[token] = {"path": final_path, "name": download_name}
+        token = new_token()
+        with DOWNLOAD_MAP_LOCK:
+            DOWNLOAD_MAP[token] = {"path": final_path, "name": download_name}
 
         # Notify the client it's ready
         socketio.emit("progress", {
@@ -235,6 +507,38 @@ def run_download(url, option, progress_id):
         socketio.emit("progress", {"status": "error", "message": str(e)}, to=progress_id)
 
 
+def run_batch_download(urls, option, progress_id):
+    """Download several URLs in turn, then provide one token for a ZIP of all."""
+    files = []
+    try:
+        for url in urls:
+            files.append(fetch_media(url, option, progress_id))
+
+        token = new_token()
+        with DOWNLOAD_MAP_LOCK:
+            DOWNLOAD_MAP[token] = {"files": files, "name": BATCH_ZIP_NAME}
+
+        socketio.emit("progress", {
+            "status": "ready",
+            "url": f"/download/{token}",
+            "filename": BATCH_ZIP_NAME
+        }, to=progress_id)
+
+    except Exception as e:
+        print(f"[ERROR] run_batch_download failed: {e}")
+        for path, _ in files:
+            remove_file(path)
+        socketio.emit("progress", {"status": "error", "message": str(e)}, to=progress_id)
+
+
+def run_queued_download(url, option, progress_id, task=run_download):
+    """Wait for a free download slot, then run the download (or batch)."""
+    if DOWNLOAD_SLOTS.locked():
+        socketio.emit("progress", {"status": "queued"}, to=progress_id)
+    with DOWNLOAD_SLOTS:
+        task(url, option, progress_id)
+
+
 @app.route("/start_download", methods=["POST"])
 def start_download():
     url = (request.form.get("url") or "").strip()
@@ -244,29 +548,148 @@ def start_download():
     if not url or option not in {"1", "2"} or not progress_id:
         return "Missing or invalid parameters", 400
 
-    Thread(target=run_download, args=(url, option, progress_id)).start()
+    # Green thread on the eventlet hub (same loop that serves Socket.IO)
+    socketio.start_background_task(run_queued_download, url, option, progress_id)
     return jsonify({"started": True})
 
 
+@app.route("/batch_download", methods=["POST"])
+def batch_download():
+    urls = [u.strip() for u in request.form.getlist("url") if u.strip()]
+    option = (request.form.get("option") or "").strip()
+    progress_id = (request.form.get("progress_id") or "").strip()
+
+    if not urls or len(urls) > MAX_BATCH_URLS or option not in {"1", "2"} or not progress_id:
+        return "Missing or invalid parameters", 400
+
+    # One slot for the whole batch; items download one after another
+    socketio.start_background_task(run_queued_download, urls, option, progress_id, run_batch_download)
+    return jsonify({"started": True})
+
+
+class ZipChunkStream(io.RawIOBase):
+    """Write-only sink that lets zipfile build an archive we stream out."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(files):
+    """Stream (path, name) files as an uncompressed ZIP, then delete them."""
+    stream = ZipChunkStream()
+    seen = set()
+    try:
+        # Media is already compressed: ZIP_STORED is a plain byte copy
+        with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_STORED) as zf:
+            for path, name in files:
+                base, ext = os.path.splitext(name)
+                arcname, n = name, 1
+                while arcname in seen:
+                    arcname, n = f"{base}-{n}{ext}", n + 1
+                seen.add(arcname)
+
+                with open(path, "rb") as src, zf.open(arcname, mode="w", force_zip64=True) as dst:
+                    while block := src.read(ZIP_CHUNK_SIZE):
+                        dst.write(block)
+                        if data := stream.drain():
+                            yield data
+        if data := stream.drain():
+            yield data
+    finally:
+        for path, _ in files:
+            remove_file(path)
+
+
 @app.route("/download/<token>")
 def download_file(token):
-    info = DOWNLOAD_MAP.pop(token, None)
+    with DOWNLOAD_MAP_LOCK:
+        info = DOWNLOAD_MAP.pop(token, None)
     if not info:
         return "Link expired or invalid", 404
 
+    if "files" in info:
+        return app.response_class(
+            iter_zip(info["files"]),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f"attachment; filename={info['name']}"},
+        )
+
     file_path, download_name = info["path"], info["name"]
-    if not os.path.exists(file_path):
-        return "File not found", 404
+    proxied = bool(X_ACCEL_PREFIX) or app.config["USE_X_SENDFILE"]
 
     @after_this_request
     def cleanup(resp):
-        try:
-            os.remove(file_path)
-        except Exception as e:
-            print(f"[WARN] Cleanup failed: {e}")
+        # Unlink off the request path; an already-open handle keeps serving
+        if proxied:
+            socketio.start_background_task(remove_file, file_path, PROXY_CLEANUP_DELAY)
+        else:
+            remove_file(file_path)
         return resp
 
-    return send_file(file_path, as_attachment=True, download_name=download_name)
+    if X_ACCEL_PREFIX:
+        resp = app.response_class(
+            mimetype=mimetypes.guess_type(download_name)[0] or "application/octet-stream")
+        resp.headers["X-Accel-Redirect"] = X_ACCEL_PREFIX + quote(os.path.basename(file_path))
+        resp.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        return resp
+
+    try:
+        return send_file(file_path, as_attachment=True, download_name=download_name,
+                         max_age=0, conditional=True)
+    except FileNotFoundError:
+        return "File not found", 404
+
+
+def remove_file(file_path, delay=0):
+    """Queue a served file for deletion, optionally after a grace period."""
+    if delay:
+        socketio.sleep(delay)
+    DELETE_QUEUE.put(file_path)
+
+
+def delete_worker():
+    """Single background task that drains DELETE_QUEUE in batches."""
+    while True:
+        batch = [DELETE_QUEUE.get()]
+        while len(batch) < DELETE_BATCH_SIZE:
+            try:
+                batch.append(DELETE_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        for file_path in batch:
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass  # already gone (e.g. link served a missing file)
+            except Exception as e:
+                print(f"[WARN] Cleanup failed: {e}")
+
+
+def download_map_sweeper():
+    """Periodically expire unused download links (and delete their files)."""
+    while True:
+        socketio.sleep(DOWNLOAD_SWEEP_INTERVAL)
+        with DOWNLOAD_MAP_LOCK:
+            expired = DOWNLOAD_MAP.expire()
+        if expired:
+            print(f"[INFO] Expired {len(expired)} unused download link(s)")
+
+
+socketio.start_background_task(delete_worker)
+socketio.start_background_task(download_map_sweeper)
 
 
 if __name__ == "__main__":